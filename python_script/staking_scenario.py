@@ -1,66 +1,148 @@
 import datetime
+from collections import deque
 from decimal import Decimal, getcontext
 
 # Set the precision for Decimal calculations
 getcontext().prec = 30
 
+# Fixed-point scales, matching PRECISION_FACTOR and DURATION_MULTIPLIER_PRECISION in MeliesStaking
+AMOUNT_PRECISION = 10**12
+MULTIPLIER_PRECISION = 10**2
+PONDERATED_PRECISION = AMOUNT_PRECISION * MULTIPLIER_PRECISION
+# Binary scale of the per-day reward rate (daily budget / total ponderated stake)
+RATE_PRECISION_BITS = 128
+RATE_ROUNDING = 1 << (RATE_PRECISION_BITS - 1)  # Round rewards to nearest rather than down
+
+START_DATE = datetime.date(2024, 1, 1)
+
+def to_fixed_point(value, precision):
+    if not isinstance(value, Decimal):  # Callers mostly pass Decimal already
+        value = Decimal(value)
+    return int(value * precision)
+
+def from_fixed_point(value, precision):
+    return Decimal(value) / precision
+
 class Stake:
+    __slots__ = ('owner', 'amount', 'multiplier', 'rewards', 'pond', 'is_flat', 'reward_index', 'slot')
+
     def __init__(self, owner, amount, multiplier):
         self.owner = owner
-        self.amount = Decimal(amount)
-        self.multiplier = Decimal(multiplier)
-        self.rewards = Decimal('0')
+        self.amount = amount
+        self.multiplier = multiplier
+        self.rewards = 0
+        self.pond = amount * multiplier  # Ponderated amount, kept in sync with amount
+        self.is_flat = multiplier == MULTIPLIER_PRECISION
+        self.reward_index = 0  # StakingSystem.flat_reward_index when rewards were last settled
+        self.slot = None  # Position in StakingSystem.flat_stakes or weighted_stakes
 
 class StakingSystem:
     def __init__(self, daily_budget):
-        self.stakes = []
-        self.daily_budget = Decimal(daily_budget)
-        self.total_ponderated_stake = Decimal('0')
-        self.current_date = datetime.date(2024, 1, 1)  # Starting date
+        self.stakes = []  # All stakes in staking order, for status output
+        # Flat (x1) stakes accrue rewards separately, weighted stakes compound them
+        self.flat_stakes = []
+        self.weighted_stakes = []
+        self._by_owner = {}  # owner -> deque of their stakes, in staking order
+        self.daily_budget = to_fixed_point(daily_budget, AMOUNT_PRECISION)
+        self.total_ponderated_stake = 0
+        # Sum of the daily rates so far; flat stake rewards are settled from it lazily
+        self.flat_reward_index = 0
+        self.current_day = 0  # Days elapsed since START_DATE
+
+    @property
+    def current_date(self):
+        return START_DATE + datetime.timedelta(days=self.current_day)
+
+    @property
+    def ponderated_int(self):
+        return self.total_ponderated_stake // PONDERATED_PRECISION  # Rounded down
 
     def add_stake(self, owner, amount, multiplier):
-        stake = Stake(owner, Decimal(amount), Decimal(multiplier))
+        stake = Stake(owner, to_fixed_point(amount, AMOUNT_PRECISION), to_fixed_point(multiplier, MULTIPLIER_PRECISION))
         self.stakes.append(stake)
-        self.total_ponderated_stake += stake.amount * stake.multiplier
+        stakes = self.flat_stakes if stake.is_flat else self.weighted_stakes
+        stake.slot = len(stakes)
+        stake.reward_index = self.flat_reward_index
+        stakes.append(stake)
+        self._by_owner.setdefault(owner, deque()).append(stake)
+        self.total_ponderated_stake += stake.pond
 
     def unstake(self, owner, stake_index):
-        stakes_by_owner = [s for s in self.stakes if s.owner == owner]
-        if 0 <= stake_index < len(stakes_by_owner):
-            stake = stakes_by_owner[stake_index]
-            self.total_ponderated_stake -= stake.amount * stake.multiplier
+        owner_stakes = self._by_owner.get(owner, ())
+        if 0 <= stake_index < len(owner_stakes):
+            stake = owner_stakes[stake_index]
+            self.total_ponderated_stake -= stake.pond
+            self._settle_rewards(stake)
             total_return = stake.amount + stake.rewards
+            del owner_stakes[stake_index]
             self.stakes.remove(stake)
-            return total_return
+            stakes = self.flat_stakes if stake.is_flat else self.weighted_stakes
+            last_stake = stakes.pop()
+            if last_stake is not stake:
+                stakes[stake.slot] = last_stake
+                last_stake.slot = stake.slot
+            return from_fixed_point(total_return, AMOUNT_PRECISION)
         return Decimal('0')
 
+    def _pending_rewards(self, stake):
+        accrued_rate = self.flat_reward_index - stake.reward_index
+        return (stake.pond * accrued_rate + RATE_ROUNDING) >> RATE_PRECISION_BITS
+
+    def _settle_rewards(self, stake):
+        if stake.is_flat:
+            stake.rewards += self._pending_rewards(stake)
+            stake.reward_index = self.flat_reward_index
+
+    def _daily_rate(self):
+        return (self.daily_budget << RATE_PRECISION_BITS) // self.total_ponderated_stake
+
     def calculate_rewards(self):
-        for stake in self.stakes:
-            reward = stake.amount * self.daily_budget * stake.multiplier / self.total_ponderated_stake
-            if stake.multiplier == 1:
-                stake.rewards += reward
-            else:
-                stake.amount += reward
-        self.update_total_ponderated_stake()
-
-    def update_total_ponderated_stake(self):
+        if not self.total_ponderated_stake:
+            return
+        rate = self._daily_rate()
+        # Flat stakes never change their pond, so their rewards only need the summed rate
+        self.flat_reward_index += rate
+        added_ponderated_stake = 0
+        for stake in self.weighted_stakes:
+            reward = (stake.pond * rate + RATE_ROUNDING) >> RATE_PRECISION_BITS
+            stake.amount += reward
+            ponderated_reward = reward * stake.multiplier
+            stake.pond += ponderated_reward
+            added_ponderated_stake += ponderated_reward
+        # Flat stakes keep their amount, so only compounded rewards move the total
+        self.total_ponderated_stake += added_ponderated_stake
+
+    def _recompute_total_ponderated_stake(self):
         self.total_ponderated_stake = sum(stake.amount * stake.multiplier for stake in self.stakes)
 
     def simulate_day(self):
         self.calculate_rewards()
-        self.current_date += datetime.timedelta(days=1)
+        self.current_day += 1
+
+    def advance_days(self, days):
+        if self.weighted_stakes:
+            for _ in range(days):
+                self.calculate_rewards()
+        elif self.total_ponderated_stake:
+            # Only flat stakes: the total, and so the daily rate, is constant over the gap
+            self.flat_reward_index += days * self._daily_rate()
+        self.current_day += days
 
     def print_status(self, fullStatus=False):
         if fullStatus:
             print(f"Date: {self.current_date}")
             for stake in self.stakes:
-                if stake.multiplier == 1:
-                    print(f"{stake.owner}: {stake.amount+stake.rewards:,.4f} = {stake.amount:,.4f} (x1) + {stake.rewards:,.2f}")
+                amount = from_fixed_point(stake.amount, AMOUNT_PRECISION)
+                if stake.is_flat:
+                    # Read-only: settling here would round differently depending on how often we print
+                    rewards = from_fixed_point(stake.rewards + self._pending_rewards(stake), AMOUNT_PRECISION)
+                    print(f"{stake.owner}: {amount+rewards:,.4f} = {amount:,.4f} (x1) + {rewards:,.2f}")
                 else:
-                    print(f"{stake.owner}: {stake.amount:,.4f} (x{stake.multiplier})")
-            print(f"Total ponderated Stake: {self.total_ponderated_stake:,.4f}")
+                    print(f"{stake.owner}: {amount:,.4f} (x{from_fixed_point(stake.multiplier, MULTIPLIER_PRECISION)})")
+            print(f"Total ponderated Stake: {from_fixed_point(self.total_ponderated_stake, PONDERATED_PRECISION):,.4f}")
             print("--------------------")
         else:
-            print(f"{int(self.total_ponderated_stake):.3f}")  # Rounded down total ponderated stake
+            print(f"{self.ponderated_int}.000")  # Rounded down total ponderated stake
 
 # Simulation
 system = StakingSystem(daily_budget=624657534246.0)
@@ -79,16 +161,14 @@ system.simulate_day()
 system.add_stake("Bob", Decimal('10000.0e8'), Decimal('1.3'))
 
 # Day 9
-for _ in range(4):
-    system.simulate_day()
+system.advance_days(4)
 
 # Day 10
 system.simulate_day()
 system.add_stake("Charlie", Decimal('200000.0e8'), Decimal('3'))
 
 # Day 22
-for _ in range(12):
-    system.simulate_day()
+system.advance_days(12)
 
 # Day 23
 system.simulate_day()
@@ -96,8 +176,7 @@ system.print_status(True)
 unstaked_amount = system.unstake("Alice", 0)
 
 # Day 95
-for _ in range(72):
-    system.simulate_day()
+system.advance_days(72)
 
 # Day 96
 system.simulate_day()
@@ -105,16 +184,14 @@ system.print_status(True)
 unstaked_amount = system.unstake("Bob", 1)
 
 # Day 107
-for _ in range(11):
-    system.simulate_day()
+system.advance_days(11)
 
 # Day 108
 system.simulate_day()
 system.add_stake("Alice", Decimal('10000.0e8'), Decimal('2.2'))
 
 # Day 195
-for _ in range(87):
-    system.simulate_day()
+system.advance_days(87)
 
 # Day 196
 system.simulate_day()
@@ -122,18 +199,15 @@ system.print_status(True)
 unstaked_amount = system.unstake("Bob", 0)
 
 # Day 201
-for _ in range(5):
-    system.simulate_day()
+system.advance_days(5)
 system.print_status(True)
 
 # Day 601
-for _ in range(400):
-    system.simulate_day()
+system.advance_days(400)
 system.print_status(True)
 
 # Day 1200
-for _ in range(599):
-    system.simulate_day()
+system.advance_days(599)
 
 system.simulate_day()
 system.print_status(True)
\ No newline at end of file
@@ -1,90 +1,176 @@
 import sys
 import datetime
+import heapq
+import itertools
+from collections import deque
 from decimal import Decimal, getcontext
 
 # Set the precision for Decimal calculations
 getcontext().prec = 30
 
+# Fixed-point scales, matching PRECISION_FACTOR and DURATION_MULTIPLIER_PRECISION in MeliesStaking
+AMOUNT_PRECISION = 10**12
+MULTIPLIER_PRECISION = 10**2
+PONDERATED_PRECISION = AMOUNT_PRECISION * MULTIPLIER_PRECISION
+# Binary scale of the per-day reward rate (daily budget / total ponderated stake)
+RATE_PRECISION_BITS = 128
+RATE_ROUNDING = 1 << (RATE_PRECISION_BITS - 1)  # Round rewards to nearest rather than down
+
+START_DATE = datetime.date(2024, 1, 1)
+
+# Per duration index: multiplier (scaled by MULTIPLIER_PRECISION) and lock period in days
+MULTIPLIERS = (100, 130, 160, 220, 300)
+LOCK_PERIODS = (0, 90, 180, 365, 365)
+
+# Scenario action types
+STAKE_ACTION = 0
+UNSTAKE_ACTION = 1
+
+def to_fixed_point(value, precision):
+    if not isinstance(value, Decimal):  # Callers mostly pass Decimal already
+        value = Decimal(value)
+    return int(value * precision)
+
+def from_fixed_point(value, precision):
+    return Decimal(value) / precision
+
 class Stake:
+    __slots__ = ('owner', 'amount', 'multiplier', 'rewards', 'pond', 'is_flat', 'reward_index',
+                 'start_day', 'lock_period', 'slot')
+
     def __init__(self, owner, amount, multiplier, lock_period):
         self.owner = owner
-        self.amount = Decimal(amount)
-        self.multiplier = Decimal(multiplier)
-        self.rewards = Decimal('0')
-        self.start_date = None
+        self.amount = amount
+        self.multiplier = multiplier
+        self.rewards = 0
+        self.pond = amount * multiplier  # Ponderated amount, kept in sync with amount
+        self.is_flat = multiplier == MULTIPLIER_PRECISION
+        self.reward_index = 0  # StakingSystem.flat_reward_index when rewards were last settled
+        self.start_day = None
         self.lock_period = lock_period
+        self.slot = None  # Position in StakingSystem.flat_stakes or weighted_stakes
     
     def __str__(self):
-        return f"{self.owner}|{self.amount}|{self.multiplier}|{self.rewards}|{self.start_date}|{self.lock_period}"
+        amount = from_fixed_point(self.amount, AMOUNT_PRECISION)
+        multiplier = from_fixed_point(self.multiplier, MULTIPLIER_PRECISION)
+        rewards = from_fixed_point(self.rewards, AMOUNT_PRECISION)
+        return f"{self.owner}|{amount}|{multiplier}|{rewards}|{self.start_day}|{self.lock_period}"
     
     def __repr__(self):
         return self.__str__()
 
 class StakingSystem:
     def __init__(self, daily_budget):
-        self.stakes = []
-        self.daily_budget = Decimal(daily_budget)
-        self.total_ponderated_stake = Decimal('0')
-        self.current_date = datetime.date(2024, 1, 1)
+        # Flat (x1) stakes accrue rewards separately, weighted stakes compound them
+        self.flat_stakes = []
+        self.weighted_stakes = []
+        self._by_owner = {}  # owner -> deque of their stakes, in staking order
+        self.daily_budget = to_fixed_point(daily_budget, AMOUNT_PRECISION)
+        self.total_ponderated_stake = 0
+        # Sum of the daily rates so far; flat stake rewards are settled from it lazily
+        self.flat_reward_index = 0
+        self.current_day = 0  # Days elapsed since START_DATE
+
+    @property
+    def current_date(self):
+        return START_DATE + datetime.timedelta(days=self.current_day)
+
+    @property
+    def ponderated_int(self):
+        return self.total_ponderated_stake // PONDERATED_PRECISION  # Rounded down
 
     def add_stake(self, owner, amount, duration_index):
-        multipliers = [Decimal('1'), Decimal('1.3'), Decimal('1.6'), Decimal('2.2'), Decimal('3')]
-        lock_periods = [0, 90, 180, 365, 365]
-        multiplier = multipliers[duration_index]
-        lock_period = lock_periods[duration_index]
+        multiplier = MULTIPLIERS[duration_index]
+        lock_period = LOCK_PERIODS[duration_index]
         
-        stake = Stake(owner, amount, multiplier, lock_period)
-        stake.start_date = self.current_date
-        self.stakes.append(stake)
-        self.total_ponderated_stake += Decimal(amount) * multiplier
+        stake = Stake(owner, to_fixed_point(amount, AMOUNT_PRECISION), multiplier, lock_period)
+        stake.start_day = self.current_day
+        stakes = self.flat_stakes if stake.is_flat else self.weighted_stakes
+        stake.slot = len(stakes)
+        stake.reward_index = self.flat_reward_index
+        stakes.append(stake)
+        self._by_owner.setdefault(owner, deque()).append(stake)
+        self.total_ponderated_stake += stake.pond
 
     def unstake(self, owner, stake_index):
-        stakes_by_owner = [s for s in self.stakes if s.owner == owner]
-        if 0 <= stake_index < len(stakes_by_owner):
-            stake = stakes_by_owner[stake_index]
-            if (self.current_date - stake.start_date).days < stake.lock_period:
+        owner_stakes = self._by_owner.get(owner, ())
+        if 0 <= stake_index < len(owner_stakes):
+            stake = owner_stakes[stake_index]
+            if self.current_day - stake.start_day < stake.lock_period:
                 return Decimal('0')  # Cannot unstake during lock period
             
+            self._settle_rewards(stake)
             actual_stake_amount = stake.amount + stake.rewards
-            self.total_ponderated_stake -= stake.amount * stake.multiplier
-            
-            main_list_index = self.stakes.index(stake)
-            last_stake = stakes_by_owner[-1]
-            self.stakes[main_list_index] = last_stake
-            self.stakes.remove(last_stake)
+            self.total_ponderated_stake -= stake.pond
+
+            # Swap-pop keeps the removal O(1); reward order does not matter
+            del owner_stakes[stake_index]
+            stakes = self.flat_stakes if stake.is_flat else self.weighted_stakes
+            last_stake = stakes.pop()
+            if last_stake is not stake:
+                stakes[stake.slot] = last_stake
+                last_stake.slot = stake.slot
 
-            return actual_stake_amount
+            return from_fixed_point(actual_stake_amount, AMOUNT_PRECISION)
         return Decimal('0')
 
+    def _pending_rewards(self, stake):
+        accrued_rate = self.flat_reward_index - stake.reward_index
+        return (stake.pond * accrued_rate + RATE_ROUNDING) >> RATE_PRECISION_BITS
+
+    def _settle_rewards(self, stake):
+        if stake.is_flat:
+            stake.rewards += self._pending_rewards(stake)
+            stake.reward_index = self.flat_reward_index
+
+    def _daily_rate(self):
+        return (self.daily_budget << RATE_PRECISION_BITS) // self.total_ponderated_stake
+
     def calculate_rewards(self):
-        total_reward = Decimal('0')
-        for stake in self.stakes:
-            reward = stake.amount * self.daily_budget * stake.multiplier / self.total_ponderated_stake
-            total_reward += reward
-            if stake.multiplier == 1:
-                stake.rewards += reward
-            else:
-                stake.amount += reward
-        self.update_total_ponderated_stake()
-        #print(f"{self.total_ponderated_stake:.6f} {total_reward:.6f}")
-
-    def update_total_ponderated_stake(self):
-        self.total_ponderated_stake = sum(stake.amount * stake.multiplier for stake in self.stakes)
+        if not self.total_ponderated_stake:
+            return
+        rate = self._daily_rate()
+        # Flat stakes never change their pond, so their rewards only need the summed rate
+        self.flat_reward_index += rate
+        added_ponderated_stake = 0
+        for stake in self.weighted_stakes:
+            reward = (stake.pond * rate + RATE_ROUNDING) >> RATE_PRECISION_BITS
+            stake.amount += reward
+            ponderated_reward = reward * stake.multiplier
+            stake.pond += ponderated_reward
+            added_ponderated_stake += ponderated_reward
+        # Flat stakes keep their amount, so only compounded rewards move the total
+        self.total_ponderated_stake += added_ponderated_stake
+
+    def _recompute_total_ponderated_stake(self):
+        self.total_ponderated_stake = sum(
+            stake.amount * stake.multiplier for stake in self.flat_stakes + self.weighted_stakes
+        )
 
     def simulate_day(self):
         self.calculate_rewards()
-        self.current_date += datetime.timedelta(days=1)
+        self.current_day += 1
+
+    def advance_days(self, days):
+        if self.weighted_stakes:
+            for _ in range(days):
+                self.calculate_rewards()
+        elif self.total_ponderated_stake:
+            # Only flat stakes: the total, and so the daily rate, is constant over the gap
+            self.flat_reward_index += days * self._daily_rate()
+        self.current_day += days
     
     def print_status(self):
-        print(f"{self.total_ponderated_stake:.20f}")
+        fraction = self.total_ponderated_stake % PONDERATED_PRECISION
+        # PONDERATED_PRECISION has 14 decimals; pad to the 20 the Decimal output used to show
+        print(f"{self.ponderated_int}.{fraction:014d}000000")
 
 def generate_and_simulate_scenario(num_stakers, duration, num_stake, num_unstake):
     action_per_day = 150
     system = StakingSystem(daily_budget=Decimal('624657534246.0'))
     actions = []
     stakers = [f"user{i+1}" for i in range(num_stakers)]
-    user_stakes = {user: [] for user in stakers}
-    lock_periods = [0, 90, 180, 365, 365]
+    user_stakes = [deque() for _ in stakers]  # Indexed by user id
 
     stake_amounts = [Decimal('5000.0e8'), Decimal('6000.0e8'), Decimal('7000.0e8'), Decimal('5000.0e8')]
     #duration_indices = [0, 0, 0, 0]
@@ -93,65 +179,61 @@ def generate_and_simulate_scenario(num_stakers, duration, num_stake, num_unstake
 
     total_actions = num_stakers * (num_stake + num_unstake)
     action_interval = max(1, duration // total_actions)
+    # Heap of (day, sequence, action type, user id, index); sequence keeps same-day actions in insertion order
     action_queue = []
+    sequence = itertools.count()
 
     day = 1
     for i in range(num_stake):
         counter = 1
-        for user in stakers:
-            action_queue.append((day, "stake", user, i % 4))
+        for user in range(num_stakers):
+            action_queue.append((day, next(sequence), STAKE_ACTION, user, i % 4))
             if(counter % action_per_day == 0):
                 day += action_interval
             counter += 1
     for i in range(num_unstake):
         counter = 1
-        for user in stakers:
-            action_queue.append((day, "unstake", user, i % 4))
+        for user in range(num_stakers):
+            action_queue.append((day, next(sequence), UNSTAKE_ACTION, user, i % 4))
             if(counter % action_per_day == 0):
                 day += action_interval
             counter += 1
-    
-    action_queue = sorted(action_queue, key=lambda x: x[0])
-    action_queue = [item for item in action_queue if item[0] <= duration]
+
+    heapq.heapify(action_queue)
 
     day = 1
-    while action_queue and day <= duration:
-        expected_day, action_type, user, index = action_queue.pop(0)
+    while action_queue:
+        expected_day, _, action_type, user, index = heapq.heappop(action_queue)
+        if expected_day > duration:
+            break
 
-        while expected_day > day and day <= duration:
-            system.simulate_day()
-            day += 1
+        if expected_day > day:
+            system.advance_days(expected_day - day)
+            day = expected_day
 
-        if action_type == "stake":
+        owner = stakers[user]
+        if action_type == STAKE_ACTION:
             amount = stake_amounts[index]
             duration_index = duration_indices[index]
-            system.add_stake(user, amount, duration_index)
+            system.add_stake(owner, amount, duration_index)
             user_stakes[user].append((day, amount, duration_index))
-            actions.append(f"{day}|stake|{user}|{int(amount)}|{duration_index}")
-        elif action_type == "unstake":
+            actions.append(f"{day}|stake|{owner}|{int(amount)}|{duration_index}")
+        elif action_type == UNSTAKE_ACTION:
             if len(user_stakes[user]) > index:
                 stake_day, _, stake_duration_index = user_stakes[user][0]
-                lock_period = lock_periods[stake_duration_index] + 1
+                lock_period = LOCK_PERIODS[stake_duration_index] + 1
                 if day - stake_day > lock_period:
-                    unstaked_amount = system.unstake(user, 0)
+                    unstaked_amount = system.unstake(owner, 0)
                     if unstaked_amount > 0:
-                        actions.append(f"{day}|unstake|{user}|{0}|{0}")
-                        user_stakes[user].pop(0)
+                        actions.append(f"{day}|unstake|{owner}|{0}|{0}")
+                        user_stakes[user].popleft()
                 else:
-                    action_queue.append((stake_day + lock_period+1, action_type, user, index))
-                    action_queue = [item for item in action_queue if item[0] <= duration]
-                    action_queue = sorted(action_queue, key=lambda x: x[0])
-
-        if expected_day > day:
-            system.simulate_day()
-            day += 1
+                    heapq.heappush(action_queue, (stake_day + lock_period+1, next(sequence), action_type, user, index))
 
-    while day <= duration:
-        system.simulate_day()
-        day += 1
+    if day <= duration:
+        system.advance_days(duration + 1 - day)
 
-    actions = [item for item in actions if int(item.split("|")[0]) <= duration]
-    return ",".join(actions), int(system.total_ponderated_stake)
+    return ",".join(actions), system.ponderated_int
 
 if __name__ == "__main__":
     num_stakers = int(sys.argv[1])